@@ -1,6 +1,7 @@
 from flask import Flask, request, jsonify, render_template_string
 from flask_cors import CORS
 import os
+import hashlib
 import psycopg2
 import psycopg2.extras
 from datetime import datetime
@@ -12,6 +13,23 @@ CORS(app)
 # Database configuration
 DATABASE_URL = os.environ.get('DATABASE_URL')
 
+# Content deduplication: when enabled, note bodies are stored once per unique
+# content in note_contents (keyed by SHA-256, reference counted) and notes
+# only point at the hash. Reads work in either mode, so it can be toggled.
+CONTENT_DEDUP = os.environ.get('CONTENT_DEDUP', '').lower() in ('1', 'true', 'yes')
+
+# A note's body: inline in notes.content for rows written without dedup,
+# otherwise from note_contents (NULL if that body is missing, never '')
+NOTE_CONTENT = 'CASE WHEN notes.content_hash IS NULL THEN notes.content ELSE note_contents.content END'
+
+# Notes joined with their deduplicated body
+NOTE_SELECT = '''
+    SELECT notes.id, notes.title, ''' + NOTE_CONTENT + ''' AS content,
+           notes.created_at, notes.updated_at
+    FROM notes
+    LEFT JOIN note_contents ON note_contents.hash = notes.content_hash
+'''
+
 def get_db_connection():
     """Get database connection"""
     if DATABASE_URL:
@@ -40,6 +58,14 @@ def init_db():
                     updated_at TIMESTAMP NOT NULL
                 )
             ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS note_contents (
+                    hash TEXT PRIMARY KEY,
+                    content TEXT NOT NULL,
+                    ref_count INTEGER NOT NULL
+                )
+            ''')
+            cursor.execute('ALTER TABLE notes ADD COLUMN IF NOT EXISTS content_hash TEXT')
         conn.commit()
     else:
         # SQLite setup for development
@@ -52,10 +78,77 @@ def init_db():
                 updated_at TEXT NOT NULL
             )
         ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS note_contents (
+                hash TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                ref_count INTEGER NOT NULL
+            )
+        ''')
+        columns = [row['name'] for row in conn.execute('PRAGMA table_info(notes)')]
+        if 'content_hash' not in columns:
+            conn.execute('ALTER TABLE notes ADD COLUMN content_hash TEXT')
         conn.commit()
     
     conn.close()
 
+def content_hash(content):
+    """Get the SHA-256 hex digest used to address a note body"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+def acquire_content(db, digest, content):
+    """Store a note body, or add a reference if it is already stored"""
+    if DATABASE_URL:
+        # PostgreSQL
+        db.execute(
+            'INSERT INTO note_contents (hash, content, ref_count) VALUES (%s, %s, 1) '
+            'ON CONFLICT (hash) DO UPDATE SET ref_count = note_contents.ref_count + 1',
+            (digest, content)
+        )
+    else:
+        # SQLite
+        db.execute(
+            'INSERT INTO note_contents (hash, content, ref_count) VALUES (?, ?, 1) '
+            'ON CONFLICT (hash) DO UPDATE SET ref_count = ref_count + 1',
+            (digest, content)
+        )
+
+def release_content(db, digest):
+    """Drop a reference to a note body, deleting it once unreferenced"""
+    if DATABASE_URL:
+        # PostgreSQL
+        db.execute('UPDATE note_contents SET ref_count = ref_count - 1 WHERE hash = %s', (digest,))
+        db.execute('DELETE FROM note_contents WHERE hash = %s AND ref_count <= 0', (digest,))
+    else:
+        # SQLite
+        db.execute('UPDATE note_contents SET ref_count = ref_count - 1 WHERE hash = ?', (digest,))
+        db.execute('DELETE FROM note_contents WHERE hash = ? AND ref_count <= 0', (digest,))
+
+def store_content(db, content, old_hash=None):
+    """Get the (content, content_hash) to store on a note, or None if unchanged"""
+    if not CONTENT_DEDUP:
+        if old_hash:
+            release_content(db, old_hash)
+        return content, None
+
+    digest = content_hash(content)
+    if digest == old_hash:
+        return None
+
+    acquire_content(db, digest, content)
+    if old_hash:
+        release_content(db, old_hash)
+    # notes.content is NOT NULL, so deduplicated rows hold '' and are read
+    # through note_contents only
+    return '', digest
+
+def missing_content_error(notes):
+    """Get an error response if any note's deduplicated body is missing"""
+    missing = [note['id'] for note in notes if note['content'] is None]
+    if missing:
+        return jsonify({'error': f'Content missing for notes {missing}'}), 500
+    return None
+
 # Initialize database
 init_db()
 
@@ -450,15 +543,15 @@ def get_notes():
     if DATABASE_URL:
         # PostgreSQL
         with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
-            cursor.execute('SELECT * FROM notes ORDER BY created_at DESC')
+            cursor.execute(NOTE_SELECT + ' ORDER BY notes.created_at DESC')
             notes = cursor.fetchall()
     else:
         # SQLite
-        notes = conn.execute('SELECT * FROM notes ORDER BY created_at DESC').fetchall()
+        notes = conn.execute(NOTE_SELECT + ' ORDER BY notes.created_at DESC').fetchall()
         notes = [dict(note) for note in notes]
     
     conn.close()
-    return jsonify(notes)
+    return missing_content_error(notes) or jsonify(notes)
 
 @app.route('/api/notes', methods=['POST'])
 def create_note():
@@ -468,6 +561,9 @@ def create_note():
     if not data or 'title' not in data or 'content' not in data:
         return jsonify({'error': 'Title and content are required'}), 400
     
+    if not isinstance(data['content'], str):
+        return jsonify({'error': 'Content must be a string'}), 400
+    
     now = datetime.now()
     conn = get_db_connection()
     
@@ -475,21 +571,25 @@ def create_note():
         if DATABASE_URL:
             # PostgreSQL
             with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+                content, digest = store_content(cursor, data['content'])
                 cursor.execute(
-                    'INSERT INTO notes (title, content, created_at, updated_at) VALUES (%s, %s, %s, %s) RETURNING *',
-                    (data['title'], data['content'], now, now)
+                    'INSERT INTO notes (title, content, content_hash, created_at, updated_at) VALUES (%s, %s, %s, %s, %s) RETURNING id',
+                    (data['title'], content, digest, now, now)
                 )
+                note_id = cursor.fetchone()['id']
+                cursor.execute(NOTE_SELECT + ' WHERE notes.id = %s', (note_id,))
                 note = cursor.fetchone()
                 conn.commit()
         else:
             # SQLite
+            content, digest = store_content(conn, data['content'])
             cursor = conn.execute(
-                'INSERT INTO notes (title, content, created_at, updated_at) VALUES (?, ?, ?, ?)',
-                (data['title'], data['content'], now.isoformat(), now.isoformat())
+                'INSERT INTO notes (title, content, content_hash, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+                (data['title'], content, digest, now.isoformat(), now.isoformat())
             )
             note_id = cursor.lastrowid
             conn.commit()
-            note = conn.execute('SELECT * FROM notes WHERE id = ?', (note_id,)).fetchone()
+            note = conn.execute(NOTE_SELECT + ' WHERE notes.id = ?', (note_id,)).fetchone()
             note = dict(note)
         
         conn.close()
@@ -507,11 +607,11 @@ def get_note(note_id):
     if DATABASE_URL:
         # PostgreSQL
         with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
-            cursor.execute('SELECT * FROM notes WHERE id = %s', (note_id,))
+            cursor.execute(NOTE_SELECT + ' WHERE notes.id = %s', (note_id,))
             note = cursor.fetchone()
     else:
         # SQLite
-        note = conn.execute('SELECT * FROM notes WHERE id = ?', (note_id,)).fetchone()
+        note = conn.execute(NOTE_SELECT + ' WHERE notes.id = ?', (note_id,)).fetchone()
         if note:
             note = dict(note)
     
@@ -520,7 +620,7 @@ def get_note(note_id):
     if not note:
         return jsonify({'error': 'Note not found'}), 404
     
-    return jsonify(dict(note))
+    return missing_content_error([note]) or jsonify(dict(note))
 
 @app.route('/api/notes/<int:note_id>', methods=['PUT'])
 def update_note(note_id):
@@ -529,12 +629,17 @@ def update_note(note_id):
     data = request.get_json()
     now = datetime.now()
     
+    if data and 'content' in data and not isinstance(data['content'], str):
+        conn.close()
+        return jsonify({'error': 'Content must be a string'}), 400
+    
     try:
         if DATABASE_URL:
             # PostgreSQL
             with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
-                # Check if note exists
-                cursor.execute('SELECT * FROM notes WHERE id = %s', (note_id,))
+                # Check if note exists, locking it so concurrent updates
+                # cannot both release the same old content_hash
+                cursor.execute('SELECT title, content_hash FROM notes WHERE id = %s FOR UPDATE', (note_id,))
                 existing_note = cursor.fetchone()
                 
                 if not existing_note:
@@ -542,35 +647,59 @@ def update_note(note_id):
                     return jsonify({'error': 'Note not found'}), 404
                 
                 title = data.get('title', existing_note['title'])
-                content = data.get('content', existing_note['content'])
+                stored = None
+                if 'content' in data:
+                    stored = store_content(cursor, data['content'], existing_note['content_hash'])
                 
-                cursor.execute(
-                    'UPDATE notes SET title = %s, content = %s, updated_at = %s WHERE id = %s RETURNING *',
-                    (title, content, now, note_id)
-                )
+                if stored:
+                    # Body changed: point the note at its new content
+                    content, digest = stored
+                    cursor.execute(
+                        'UPDATE notes SET title = %s, content = %s, content_hash = %s, updated_at = %s WHERE id = %s',
+                        (title, content, digest, now, note_id)
+                    )
+                else:
+                    # Body unchanged: skip rewriting it
+                    cursor.execute(
+                        'UPDATE notes SET title = %s, updated_at = %s WHERE id = %s',
+                        (title, now, note_id)
+                    )
+                cursor.execute(NOTE_SELECT + ' WHERE notes.id = %s', (note_id,))
                 note = cursor.fetchone()
                 conn.commit()
         else:
-            # SQLite
-            existing_note = conn.execute('SELECT * FROM notes WHERE id = ?', (note_id,)).fetchone()
+            # SQLite: take the write lock before reading the old content_hash
+            conn.execute('BEGIN IMMEDIATE')
+            existing_note = conn.execute('SELECT title, content_hash FROM notes WHERE id = ?', (note_id,)).fetchone()
             
             if not existing_note:
                 conn.close()
                 return jsonify({'error': 'Note not found'}), 404
             
             title = data.get('title', existing_note['title'])
-            content = data.get('content', existing_note['content'])
+            stored = None
+            if 'content' in data:
+                stored = store_content(conn, data['content'], existing_note['content_hash'])
             
-            conn.execute(
-                'UPDATE notes SET title = ?, content = ?, updated_at = ? WHERE id = ?',
-                (title, content, now.isoformat(), note_id)
-            )
+            if stored:
+                # Body changed: point the note at its new content
+                content, digest = stored
+                conn.execute(
+                    'UPDATE notes SET title = ?, content = ?, content_hash = ?, updated_at = ? WHERE id = ?',
+                    (title, content, digest, now.isoformat(), note_id)
+                )
+            else:
+                # Body unchanged: skip rewriting it
+                conn.execute(
+                    'UPDATE notes SET title = ?, updated_at = ? WHERE id = ?',
+                    (title, now.isoformat(), note_id)
+                )
             conn.commit()
-            note = conn.execute('SELECT * FROM notes WHERE id = ?', (note_id,)).fetchone()
+            note = conn.execute(NOTE_SELECT + ' WHERE notes.id = ?', (note_id,)).fetchone()
             note = dict(note)
         
         conn.close()
-        return jsonify({'success': True, 'note': dict(note)})
+        return missing_content_error([note]) or jsonify({'success': True, 'note': dict(note)})
         
     except Exception as e:
         conn.close()
@@ -585,17 +714,23 @@ def delete_note(note_id):
         if DATABASE_URL:
             # PostgreSQL
             with conn.cursor() as cursor:
-                cursor.execute('DELETE FROM notes WHERE id = %s', (note_id,))
+                cursor.execute('DELETE FROM notes WHERE id = %s RETURNING content_hash', (note_id,))
                 if cursor.rowcount == 0:
                     conn.close()
                     return jsonify({'error': 'Note not found'}), 404
+                digest = cursor.fetchone()[0]
+                if digest:
+                    release_content(cursor, digest)
                 conn.commit()
         else:
             # SQLite
-            cursor = conn.execute('DELETE FROM notes WHERE id = ?', (note_id,))
+            cursor = conn.execute('DELETE FROM notes WHERE id = ? RETURNING content_hash', (note_id,))
+            deleted_note = cursor.fetchone()
             if cursor.rowcount == 0:
                 conn.close()
                 return jsonify({'error': 'Note not found'}), 404
+            if deleted_note['content_hash']:
+                release_content(conn, deleted_note['content_hash'])
             conn.commit()
         
         conn.close()
@@ -619,20 +754,20 @@ def search_notes():
         # PostgreSQL (case-insensitive search)
         with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
             cursor.execute(
-                'SELECT * FROM notes WHERE title ILIKE %s OR content ILIKE %s ORDER BY created_at DESC',
+                NOTE_SELECT + ' WHERE notes.title ILIKE %s OR ' + NOTE_CONTENT + ' ILIKE %s ORDER BY notes.created_at DESC',
                 (f'%{query}%', f'%{query}%')
             )
             notes = cursor.fetchall()
     else:
         # SQLite
         notes = conn.execute(
-            'SELECT * FROM notes WHERE title LIKE ? OR content LIKE ? ORDER BY created_at DESC',
+            NOTE_SELECT + ' WHERE notes.title LIKE ? OR ' + NOTE_CONTENT + ' LIKE ? ORDER BY notes.created_at DESC',
             (f'%{query}%', f'%{query}%')
         ).fetchall()
         notes = [dict(note) for note in notes]
     
     conn.close()
-    return jsonify(notes)
+    return missing_content_error(notes) or jsonify(notes)
 
 if __name__ == '__main__':
     print("Starting Note-Taking Backend Server...")
@@ -640,6 +775,8 @@ if __name__ == '__main__':
         print("✅ Using PostgreSQL database")
     else:
         print("⚠️  Using SQLite fallback (development mode)")
+    if CONTENT_DEDUP:
+        print("✅ Content deduplication enabled")
     
     print("API endpoints:")
     print("  GET    /api/notes          - Get all notes")
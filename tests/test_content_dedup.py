@@ -0,0 +1,127 @@
+import importlib
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture
+def notes_app(tmp_path, monkeypatch):
+    """Import the app against a fresh SQLite database in tmp_path"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    monkeypatch.setenv('CONTENT_DEDUP', '1')
+    import app
+    app = importlib.reload(app)
+    return app
+
+
+@pytest.fixture
+def client(notes_app):
+    return notes_app.app.test_client()
+
+
+def db_rows(query, params=()):
+    conn = sqlite3.connect('notes.db')
+    rows = conn.execute(query, params).fetchall()
+    conn.close()
+    return rows
+
+
+def ref_counts():
+    return dict(db_rows('SELECT content, ref_count FROM note_contents'))
+
+
+def create(client, title, content):
+    response = client.post('/api/notes', json={'title': title, 'content': content})
+    assert response.status_code == 201
+    return response.get_json()['note']
+
+
+def test_shared_bodies_are_stored_once(client):
+    first = create(client, 'a', 'template')
+    second = create(client, 'b', 'template')
+
+    assert ref_counts() == {'template': 2}
+    assert db_rows('SELECT content FROM notes') == [('',), ('',)]
+    assert first['content'] == second['content'] == 'template'
+    assert [note['content'] for note in client.get('/api/notes').get_json()] == ['template', 'template']
+    assert len(client.get('/api/notes/search?q=templ').get_json()) == 2
+
+
+def test_unchanged_body_put_skips_content_write(client):
+    note = create(client, 'a', 'template')
+    [(digest,)] = db_rows('SELECT content_hash FROM notes')
+
+    response = client.put(f"/api/notes/{note['id']}", json={'title': 'renamed', 'content': 'template'})
+
+    assert response.status_code == 200
+    assert response.get_json()['note']['title'] == 'renamed'
+    assert response.get_json()['note']['content'] == 'template'
+    assert db_rows('SELECT content_hash FROM notes') == [(digest,)]
+    assert ref_counts() == {'template': 1}
+
+
+def test_changed_body_put_releases_old_hash(client):
+    note = create(client, 'a', 'template')
+    create(client, 'b', 'template')
+
+    response = client.put(f"/api/notes/{note['id']}", json={'content': 'edited'})
+    assert response.get_json()['note']['content'] == 'edited'
+    assert ref_counts() == {'template': 1, 'edited': 1}
+
+    client.put(f"/api/notes/{note['id']}", json={'content': 'edited again'})
+    assert ref_counts() == {'template': 1, 'edited again': 1}
+
+
+def test_delete_releases_hash_once(client):
+    first = create(client, 'a', 'template')
+    second = create(client, 'b', 'template')
+
+    assert client.delete(f"/api/notes/{first['id']}").status_code == 200
+    assert ref_counts() == {'template': 1}
+    assert client.delete(f"/api/notes/{first['id']}").status_code == 404
+    assert ref_counts() == {'template': 1}
+
+    assert client.get(f"/api/notes/{second['id']}").get_json()['content'] == 'template'
+    client.delete(f"/api/notes/{second['id']}")
+    assert ref_counts() == {}
+
+
+def test_toggling_dedup_keeps_existing_rows_readable(notes_app, client, monkeypatch):
+    monkeypatch.setattr(notes_app, 'CONTENT_DEDUP', False)
+    inline = create(client, 'inline', 'template')
+    assert ref_counts() == {}
+
+    monkeypatch.setattr(notes_app, 'CONTENT_DEDUP', True)
+    deduped = create(client, 'deduped', 'template')
+    client.put(f"/api/notes/{inline['id']}", json={'content': 'template'})
+    assert ref_counts() == {'template': 2}
+
+    monkeypatch.setattr(notes_app, 'CONTENT_DEDUP', False)
+    client.put(f"/api/notes/{inline['id']}", json={'content': 'inline again'})
+    assert ref_counts() == {'template': 1}
+    assert client.get(f"/api/notes/{inline['id']}").get_json()['content'] == 'inline again'
+    assert client.get(f"/api/notes/{deduped['id']}").get_json()['content'] == 'template'
+
+
+def test_missing_body_is_an_error(client):
+    note = create(client, 'a', 'template')
+    conn = sqlite3.connect('notes.db')
+    conn.execute('DELETE FROM note_contents')
+    conn.commit()
+    conn.close()
+
+    assert client.get(f"/api/notes/{note['id']}").status_code == 500
+    assert client.get('/api/notes').status_code == 500
+
+
+@pytest.mark.parametrize('dedup', [True, False])
+def test_non_string_content_is_rejected(notes_app, client, monkeypatch, dedup):
+    monkeypatch.setattr(notes_app, 'CONTENT_DEDUP', dedup)
+
+    assert client.post('/api/notes', json={'title': 'n', 'content': None}).status_code == 400
+    assert client.post('/api/notes', json={'title': 'n', 'content': 5}).status_code == 400
+
+    note = create(client, 'n', 'body')
+    assert client.put(f"/api/notes/{note['id']}", json={'content': None}).status_code == 400
+    assert client.get(f"/api/notes/{note['id']}").get_json()['content'] == 'body'